@@ -12,10 +12,22 @@
 # ----------------------------------------------------------------------------- #
 
 from subprocess import check_output
+from concurrent.futures import ThreadPoolExecutor
+import ast
+import atexit
+import calendar
+import collections
+import hashlib
 import json
 import logging
+import math
+import logging.handlers
 import sys
 import os
+import queue
+import threading
+import time
+import numpy as np
 import requests
 import getpass
 
@@ -26,19 +38,185 @@ import getpass
 # Nice print statements are fun.  Setup a logger to do this
 print_logger = logging.getLogger(__name__)
 
-# TODO: This should be specifiable through an argparse option.  Right now, just set
-# the logging utility to the highest verbosity level
-print_logger.setLevel(logging.DEBUG)
+# Default verbosity.  Can be overridden with the ROBINHOOD_LOG_LEVEL environment
+# variable or by calling configure_logging.  Unknown level names fall back to INFO
+# rather than breaking the import.
+REQUESTED_LOG_LEVEL = os.environ.get("ROBINHOOD_LOG_LEVEL", "INFO").upper()
+DEFAULT_LOG_LEVEL = REQUESTED_LOG_LEVEL if isinstance(logging.getLevelName(REQUESTED_LOG_LEVEL), int) else "INFO"
 
-# Add a handler to tell the system where to send messages.  This one sends
-# everything to the console using standard out.
-print_console_handler = logging.StreamHandler(sys.stdout)
-print_logger.addHandler(print_console_handler)
+# Maximum number of log records waiting to be written.  If the output can't keep
+# up, new records are dropped rather than blocking the caller.
+LOG_QUEUE_SIZE = 10000
 
-# To print to a file as well, uncomment the following lines and add a path
-# to your desired log file.
-#    print_file_handler = logging.FileHandler('<path to file here!>')
-#    print_logger.addHandler(print_file_handler)
+# Only one out of every LOG_SAMPLE_EVERY successful read requests to the same
+# endpoint is logged.  Orders and failed requests are always logged.
+LOG_SAMPLE_EVERY = 100
+
+# Seconds to wait for room in a full queue when shutting the listener down before
+# giving up on the records still waiting in it.
+LOG_STOP_TIMEOUT = 1.0
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records off to a bounded queue that a background thread writes out.
+
+    Nothing on the calling thread ever waits on the output stream: if the queue
+    is full the record is dropped and counted in dropped_records.
+    """
+
+    def __init__(self, record_queue):
+        logging.handlers.QueueHandler.__init__(self, record_queue)
+        self.dropped_records = 0
+
+    def prepare(self, record):
+        # Message formatting is left to the listener thread.  Only records with
+        # exception info need preparing here, since tracebacks can't be pickled
+        # or safely held on to.
+        if record.exc_info:
+            return logging.handlers.QueueHandler.prepare(self, record)
+
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+
+
+class NonBlockingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener whose stop() can't fail on a full queue.
+
+    The stock listener adds its stop marker with put_nowait, which raises
+    queue.Full exactly when the output is too slow to keep up.  This waits up to
+    LOG_STOP_TIMEOUT seconds for room, then throws away queued records until the
+    marker fits.
+    """
+
+    def enqueue_sentinel(self):
+        try:
+            self.queue.put(self._sentinel, timeout = LOG_STOP_TIMEOUT)
+            return
+        except queue.Full:
+            pass
+
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+            except queue.Empty:
+                pass
+
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                continue
+
+
+class RequestSampler(logging.Filter):
+    """
+    Lets through one out of every sample_every records marked as sampled for each
+    endpoint.  Unmarked records always pass.
+    """
+
+    def __init__(self, sample_every):
+        logging.Filter.__init__(self)
+        self.sample_every = sample_every
+        self._counts = collections.defaultdict(int)
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False) or self.sample_every <= 1:
+            return True
+
+        # Races between threads here only skew the sample slightly, so don't lock
+        self._counts[record.endpoint] += 1
+
+        return self._counts[record.endpoint] % self.sample_every == 1
+
+
+print_queue_handler = None
+print_queue_listener = None
+
+
+def configure_logging(level = DEFAULT_LOG_LEVEL, stream = sys.stdout, sample_every = LOG_SAMPLE_EVERY,
+                      queue_size = LOG_QUEUE_SIZE):
+    """
+    (Re)configure print_logger.  Records are queued on the calling thread and
+    written to stream by a background listener thread.
+
+    To print to a file as well, pass the listener extra handlers, e.g.
+        print_queue_listener.handlers += (logging.FileHandler('<path to file here!>'),)
+    """
+
+    global print_queue_handler, print_queue_listener
+
+    # Detach the old handler first so nothing new lands in the queue being shut down
+    if print_queue_handler is not None:
+        print_logger.removeHandler(print_queue_handler)
+
+    _stop_logging()
+
+    print_logger.setLevel(level)
+
+    record_queue = queue.Queue(queue_size)
+
+    print_queue_handler = NonBlockingQueueHandler(record_queue)
+    print_queue_handler.addFilter(RequestSampler(sample_every))
+    print_logger.addHandler(print_queue_handler)
+
+    print_console_handler = logging.StreamHandler(stream)
+    print_queue_listener = NonBlockingQueueListener(record_queue, print_console_handler)
+    print_queue_listener.start()
+
+
+def log_request(method, url, status, latency, sampled = True):
+    """
+    Emit a structured record for one API request.  The record carries endpoint,
+    method, status and latency (in seconds) as attributes.
+
+    Successful requests are logged at DEBUG and, if sampled is True, subject to
+    sampling.  Failed requests are always logged at WARNING.
+    """
+
+    level = logging.WARNING if status >= 400 else logging.DEBUG
+
+    if not print_logger.isEnabledFor(level):
+        return
+
+    endpoint = url.split("?", 1)[0]
+
+    print_logger.log(level, "[REQUEST]: %s %s %d %.1fms", method, endpoint, status, latency * 1000.0,
+            extra = {
+                'endpoint'  : endpoint,
+                'method'    : method,
+                'status'    : status,
+                'latency'   : latency,
+                'sampled'   : sampled and status < 400
+                })
+
+
+def _stop_logging():
+    global print_queue_listener
+
+    if print_queue_listener is None:
+        return
+
+    try:
+        print_queue_listener.stop()
+    finally:
+        print_queue_listener = None
+
+
+configure_logging()
+
+if DEFAULT_LOG_LEVEL != REQUESTED_LOG_LEVEL:
+    print_logger.warning("[WARNING]: Unknown ROBINHOOD_LOG_LEVEL %s, using INFO.", REQUESTED_LOG_LEVEL)
+
+# Flush whatever is still queued when the interpreter exits
+atexit.register(_stop_logging)
 
 # ----------------------------------------------------------------------------- #
 # Defines                                                                       #
@@ -56,15 +234,23 @@ API_URLS = {
         'instrument'            : 'https://api.robinhood.com/instruments/',
         'user-info'             : 'https://api.robinhood.com/user/',
         'basic-info'            : 'https://api.robinhood.com/user/basic_info/',
-        'employent-info'        : 'https://api.robinhood.com/user/employment/',
+        'employment-info'       : 'https://api.robinhood.com/user/employment/',
         'investment-profile'    : 'https://api.robinhood.com/user/investment_profile/',
-        'positions'             : 'https://api.robinhood.com/accounts/%s/positions/'
+        'positions'             : 'https://api.robinhood.com/accounts/%s/positions/',
+
+        'historicals'           : 'https://api.robinhood.com/quotes/historicals/',
+        'fundamentals'          : 'https://api.robinhood.com/fundamentals/',
+
+        'options-chains'        : 'https://api.robinhood.com/options/chains/',
+        'options-instruments'   : 'https://api.robinhood.com/options/instruments/',
+        'options-marketdata'    : 'https://api.robinhood.com/marketdata/options/'
 
         }
 
 # Paths to configuration files
 CONFIGURATION_DIRECTORY_PATH = "./configuration"
 LOGIN_CONFIGURATION_FILE = "%s/credentials.txt" % CONFIGURATION_DIRECTORY_PATH
+HISTORICALS_CACHE_DIRECTORY_PATH = "./cache/historicals"
 
 
 # User account Information Parameters
@@ -154,6 +340,146 @@ GET_UPDATED_AT = "updated_at"
 GET_USER = "user"
 
 
+# Historical bar intervals and the length of one bar in seconds
+INTERVAL_SECONDS = {
+        '5minute'   : 5 * 60,
+        '10minute'  : 10 * 60,
+        'hour'      : 60 * 60,
+        'day'       : 24 * 60 * 60,
+        'week'      : 7 * 24 * 60 * 60
+        }
+
+# Historical spans, smallest first, and how far back in seconds each one reaches
+SPAN_SECONDS = [
+        ('day'      , 24 * 60 * 60),
+        ('week'     , 7 * 24 * 60 * 60),
+        ('month'    , 31 * 24 * 60 * 60),
+        ('3month'   , 92 * 24 * 60 * 60),
+        ('year'     , 366 * 24 * 60 * 60),
+        ('5year'    , 5 * 366 * 24 * 60 * 60)
+        ]
+
+# Spans the API will serve for each interval.  Cache top-ups only pick from these.
+INTERVAL_SPANS = {
+        '5minute'   : ['day', 'week'],
+        '10minute'  : ['day', 'week'],
+        'hour'      : ['week', 'month', '3month'],
+        'day'       : ['month', '3month', 'year', '5year'],
+        'week'      : ['year', '5year']
+        }
+
+# Trading session window in seconds after midnight UTC.  Wide enough to hold the
+# regular 9:30-16:00 Eastern session in both standard and daylight time.
+SECONDS_PER_DAY = 24 * 60 * 60
+MARKET_OPEN_UTC = 13 * 60 * 60 + 30 * 60
+MARKET_CLOSE_UTC = 21 * 60 * 60
+
+# Column layout of a cached historical bar.  begins_at is seconds since the epoch (UTC).
+BAR_DTYPE = np.dtype([
+        ('begins_at', np.int64),
+        ('open',      np.float64),
+        ('high',      np.float64),
+        ('low',       np.float64),
+        ('close',     np.float64),
+        ('volume',    np.int64)
+        ])
+
+# Number of symbols to fetch from the API at the same time
+HISTORICALS_MAX_WORKERS = 8
+
+
+# Fundamentals fields that are loaded into the universe screener as columns
+GET_MARKET_CAP = "market_cap"
+GET_VOLUME = "volume"
+GET_AVERAGE_VOLUME = "average_volume"
+GET_PE_RATIO = "pe_ratio"
+GET_DIVIDEND_YIELD = "dividend_yield"
+GET_HIGH_52_WEEKS = "high_52_weeks"
+GET_LOW_52_WEEKS = "low_52_weeks"
+GET_OPEN = "open"
+GET_HIGH = "high"
+GET_LOW = "low"
+
+SCREENER_COLUMNS = [
+        GET_MARKET_CAP,
+        GET_VOLUME,
+        GET_AVERAGE_VOLUME,
+        GET_PE_RATIO,
+        GET_DIVIDEND_YIELD,
+        GET_HIGH_52_WEEKS,
+        GET_LOW_52_WEEKS,
+        GET_OPEN,
+        GET_HIGH,
+        GET_LOW
+        ]
+
+# Expression syntax that the screener will accept.  Names are checked separately
+# against the screener's columns and constants must be plain numbers.  ** is left
+# out on purpose: integer powers like 9**9**9 can tie the process up indefinitely.
+SCREENER_ALLOWED_NODES = (
+        ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Name, ast.Load,
+        ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod,
+        ast.BitAnd, ast.BitOr, ast.Invert, ast.USub, ast.UAdd,
+        ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq
+        )
+SCREENER_CONSTANT_NODE = getattr(ast, 'Constant', None) or ast.Num
+
+# The fundamentals endpoint accepts a limited number of symbols per request
+FUNDAMENTALS_BATCH_SIZE = 10
+FUNDAMENTALS_MAX_WORKERS = 8
+
+
+# Sections of the consolidated user profile and the endpoints they come from
+USER_PROFILE_ENDPOINTS = {
+        GET_USER                : 'user-info',
+        GET_BASIC_INFO          : 'basic-info',
+        GET_EMPLOYMENT          : 'employment-info',
+        GET_INVESTMENT_PROFILE  : 'investment-profile'
+        }
+
+# Number of seconds a fetched user profile is considered fresh
+USER_PROFILE_TTL = 300
+
+
+# Default limits for the conditional-request response cache
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESPONSE_CACHE_MAX_AGE = 24 * 60 * 60
+RESPONSE_CACHE_DISK_MAX_ENTRIES = 16384
+RESPONSE_CACHE_DISK_MAX_BYTES = 512 * 1024 * 1024
+
+
+# Paper trading defaults
+PAPER_TRADING_STARTING_CASH = 100000.0
+PAPER_TRADING_ACCOUNT_NUMBER = "PAPER"
+PAPER_TRADING_INITIAL_ORDER_CAPACITY = 1024
+
+
+# Option types as stored in OptionsChain.option_type
+OPTION_CALL = 0
+OPTION_PUT = 1
+
+# Quote columns of an OptionsChain, fed from the options market data endpoint as
+# (API field, column name)
+OPTIONS_QUOTE_FIELDS = [
+        ('bid_price'            , 'bid'),
+        ('ask_price'            , 'ask'),
+        ('mark_price'           , 'mark'),
+        ('implied_volatility'   , 'implied_volatility'),
+        ('delta'                , 'delta'),
+        ('gamma'                , 'gamma'),
+        ('theta'                , 'theta'),
+        ('vega'                 , 'vega'),
+        ('rho'                  , 'rho')
+        ]
+
+# Options fetching limits.  TTLs are in seconds.
+OPTIONS_MAX_WORKERS = 16
+OPTIONS_METADATA_TTL = 60 * 60
+OPTIONS_QUOTE_TTL = 15
+OPTIONS_QUOTE_BATCH_SIZE = 20
+
+
 # ----------------------------------------------------------------------------- #
 # Build Directory Structure
 # ----------------------------------------------------------------------------- #
@@ -179,20 +505,1130 @@ class NotLoggedIn(Exception):
 class BadArgument(Exception):
     pass
 
+# ----------------------------------------------------------------------------- #
+# Historical Bar Cache                                                          #
+# ----------------------------------------------------------------------------- #
+
+class HistoricalBarCache:
+    """
+    Local cache of historical OHLCV bars.
+
+    Every (symbol, interval) pair is stored as its own .npy file of BAR_DTYPE
+    records sorted by begins_at.  Files are opened memory-mapped and read only,
+    so the arrays handed back to callers are views into the page cache rather
+    than copies.
+
+    Next to each .npy file is a small json sidecar recording the time range that
+    previous downloads have covered.  When a span is requested, only the time since
+    the end of that range is pulled from the API (using the smallest span that
+    still covers the gap), and nothing is pulled at all if the market hasn't been
+    open long enough since then to produce a new bar.  The whole span is only
+    downloaded if the covered range doesn't reach back far enough.
+    """
+
+    # One lock per cache file so concurrent fetches of the same symbol don't
+    # clobber each other's writes.
+    _file_locks = {}
+    _file_locks_lock = threading.Lock()
+
+    def __init__(self, cache_directory = HISTORICALS_CACHE_DIRECTORY_PATH):
+        self.cache_directory = cache_directory
+
+        try:
+            os.makedirs(self.cache_directory)
+        except OSError:
+            if not os.path.isdir(self.cache_directory):
+                raise
+
+    def get(self, symbol, interval, span, now = None):
+        """
+        Return the bars for symbol covering the requested span.
+
+        The result is a read only, memory-mapped BAR_DTYPE array.  Individual
+        columns can be pulled out without copying, e.g. bars['close'].
+        """
+
+        if interval not in INTERVAL_SECONDS:
+            raise BadArgument()
+
+        span_seconds = dict(SPAN_SECONDS).get(span)
+        if span_seconds is None:
+            raise BadArgument()
+
+        if now is None:
+            now = int(time.time())
+
+        start = now - span_seconds
+        path = self.get_cache_path(symbol, interval)
+
+        with self._get_file_lock(path):
+            bars = self._load(path)
+            coverage = self._load_coverage(path) if bars is not None else None
+
+            fetch_span = self._get_missing_span(coverage, interval, span, start, now)
+            if fetch_span is not None:
+                new_bars = self._fetch(symbol, interval, fetch_span)
+
+                if new_bars is not None:
+                    if len(new_bars) > 0 or bars is None:
+                        bars = self._store(path, bars, new_bars)
+
+                    fetched_from = self._get_fetched_from(coverage, start, new_bars)
+                    if fetched_from is not None:
+                        self._store_coverage(path, coverage, fetched_from, now)
+
+        if bars is None:
+            return np.zeros(0, dtype=BAR_DTYPE)
+
+        # Slicing a memmap gives back a view, not a copy
+        return bars[np.searchsorted(bars['begins_at'], start):]
+
+    def get_cache_path(self, symbol, interval):
+        return os.path.join(self.cache_directory, "%s_%s.npy" % (symbol.upper(), interval))
+
+    @staticmethod
+    def _get_coverage_path(path):
+        return "%s.coverage.json" % path
+
+    @classmethod
+    def _get_file_lock(cls, path):
+        with cls._file_locks_lock:
+            if path not in cls._file_locks:
+                cls._file_locks[path] = threading.Lock()
+
+            return cls._file_locks[path]
+
+    @staticmethod
+    def _load(path):
+        try:
+            return np.load(path, mmap_mode='r')
+        except IOError:
+            return None
+
+    @staticmethod
+    def _load_coverage(path):
+        """
+        Returns the (covered_from, covered_to) range recorded for a cache file, or
+        None if there isn't one.
+        """
+
+        try:
+            with open(HistoricalBarCache._get_coverage_path(path), "r") as infile:
+                coverage = json.load(infile)
+        except (IOError, ValueError):
+            return None
+
+        return (int(coverage["covered_from"]), int(coverage["covered_to"]))
+
+    @staticmethod
+    def _store_coverage(path, coverage, fetched_from, fetched_to):
+        """
+        Record that the cache file now holds every bar between fetched_from and
+        fetched_to, merged with the previously covered range if they touch.
+        """
+
+        covered_from = fetched_from
+        if coverage is not None and coverage[1] >= fetched_from:
+            covered_from = min(coverage[0], fetched_from)
+
+        coverage_path = HistoricalBarCache._get_coverage_path(path)
+        temporary_path = "%s.%d.tmp" % (coverage_path, threading.current_thread().ident)
+        with open(temporary_path, "w") as outfile:
+            json.dump({'covered_from' : covered_from, 'covered_to' : fetched_to}, outfile)
+        os.rename(temporary_path, coverage_path)
+
+    @staticmethod
+    def _get_market_seconds(start, end):
+        """
+        Returns how many seconds between start and end fall inside a trading
+        session (weekdays between MARKET_OPEN_UTC and MARKET_CLOSE_UTC).
+
+        Holidays aren't known here, so they count as open.
+        """
+
+        market_seconds = 0
+
+        for day in range(start // SECONDS_PER_DAY, end // SECONDS_PER_DAY + 1):
+            # January 1st 1970 was a Thursday
+            if (day + 3) % 7 >= 5:
+                continue
+
+            session_open = day * SECONDS_PER_DAY + MARKET_OPEN_UTC
+            session_close = day * SECONDS_PER_DAY + MARKET_CLOSE_UTC
+
+            market_seconds += max(0, min(end, session_close) - max(start, session_open))
+
+        return market_seconds
+
+    @staticmethod
+    def _get_fetched_from(coverage, start, new_bars):
+        """
+        Work out how far back a download can be trusted to have covered.
+
+        A full download of the requested span covers back to its start.  A top-up
+        only covers back to the first bar it returned: spans like "day" mean the
+        latest session rather than a rolling 24 hours, so the nominal span length
+        can reach back further than the response does.  Returns None if a top-up
+        came back empty, since it says nothing about the gap.
+        """
+
+        if coverage is None or coverage[0] > start:
+            return start
+
+        if len(new_bars) == 0:
+            return None
+
+        return int(new_bars['begins_at'][0])
+
+    @staticmethod
+    def _get_missing_span(coverage, interval, span, start, now):
+        """
+        Figure out the smallest span that needs to be requested from the API to
+        bring the cache up to date.  Returns None if nothing needs to be fetched.
+        """
+
+        # The cache doesn't reach back far enough, so the whole span is needed.
+        if coverage is None or coverage[0] > start:
+            return span
+
+        # No new bar can have been completed unless the market has been open for at
+        # least one bar (or one whole session, for day and week bars) since then.
+        market_seconds = HistoricalBarCache._get_market_seconds(coverage[1], now)
+        if market_seconds < min(INTERVAL_SECONDS[interval], MARKET_CLOSE_UTC - MARKET_OPEN_UTC):
+            return None
+
+        # Only spans the API serves for this interval, and never one shorter than
+        # a single bar.
+        gap = max(now - coverage[1], INTERVAL_SECONDS[interval])
+        for span_name, span_seconds in SPAN_SECONDS:
+            if span_name == span:
+                break
+            if span_seconds >= gap and span_name in INTERVAL_SPANS[interval]:
+                return span_name
+
+        return span
+
+    @staticmethod
+    def _fetch(symbol, interval, span):
+        """
+        Grab historical bars for a single symbol from the API and return them
+        as a BAR_DTYPE array.  Returns None if the request failed.
+        """
+
+        start_time = time.time()
+        response = requests.get(API_URLS['historicals'],
+                params = {'symbols' : symbol.upper(), 'interval' : interval, 'span' : span})
+        log_request("GET", API_URLS['historicals'], response.status_code, time.time() - start_time)
+
+        historical_data = json.loads(response.text)
+
+        if "results" not in historical_data.keys():
+            return None
+
+        if len(historical_data["results"]) == 0:
+            return np.zeros(0, dtype=BAR_DTYPE)
+
+        historicals = historical_data["results"][0]["historicals"]
+        new_bars = np.zeros(len(historicals), dtype=BAR_DTYPE)
+
+        for index, bar in enumerate(historicals):
+            new_bars[index] = (
+                    calendar.timegm(time.strptime(bar["begins_at"], "%Y-%m-%dT%H:%M:%SZ")),
+                    float(bar["open_price"]),
+                    float(bar["high_price"]),
+                    float(bar["low_price"]),
+                    float(bar["close_price"]),
+                    int(bar["volume"])
+                    )
+
+        return new_bars
+
+    @staticmethod
+    def _store(path, bars, new_bars):
+        """
+        Merge new bars into the cache file and reopen it memory-mapped.  Newly
+        fetched bars replace cached ones with the same timestamp, since the last
+        bar of a previous download may have still been forming.
+        """
+
+        if bars is not None:
+            new_bars = np.concatenate((new_bars, bars))
+
+        # np.unique keeps the first occurrence, which is the freshly fetched bar
+        _, unique_indices = np.unique(new_bars['begins_at'], return_index=True)
+        merged_bars = new_bars[unique_indices]
+
+        # Write to a temporary file and rename it over the old one so that readers
+        # holding the previous memmap never see a half written file.
+        temporary_path = "%s.%d.tmp" % (path, threading.current_thread().ident)
+        with open(temporary_path, "wb") as outfile:
+            np.save(outfile, merged_bars)
+        os.rename(temporary_path, path)
+
+        return np.load(path, mmap_mode='r')
+
+# ----------------------------------------------------------------------------- #
+# Universe Screener                                                             #
+# ----------------------------------------------------------------------------- #
+
+class UniverseScreener:
+    """
+    Holds the tradable universe as columnar numpy arrays so that screens can be
+    evaluated as vectorized expressions instead of loops over json dicts.
+
+    Expressions are plain python expressions over the column names in
+    SCREENER_COLUMNS, e.g.
+
+        screener.screen("tradeable & (market_cap > 1e10) & (pe_ratio < 20)",
+                        rank = "dividend_yield", limit = 25)
+
+    Use &, | and ~ (not and/or/not) to combine conditions, and parenthesize each
+    comparison.  Missing fundamentals are NaN, so any comparison against them is
+    False.  Results are cached by expression string.
+    """
+
+    def __init__(self, instruments, fundamentals):
+        """
+        instruments is the output of RobinhoodInstance.get_all_instruments and
+        fundamentals is a list of fundamentals dicts (or None) in the same order.
+        """
+
+        if len(fundamentals) != len(instruments):
+            raise BadArgument()
+
+        self.symbols = np.array([instrument["symbol"] for instrument in instruments], dtype=object)
+
+        self.columns = {
+                'tradeable' : np.array([bool(instrument.get("tradeable")) and
+                                        instrument.get("tradability") == "tradable" and
+                                        instrument.get("state") == "active"
+                                        for instrument in instruments], dtype=bool)
+                }
+
+        for column in SCREENER_COLUMNS:
+            self.columns[column] = np.array([UniverseScreener._to_float(fundamental, column)
+                                             for fundamental in fundamentals], dtype=np.float64)
+
+        self._expression_cache = {}
+        self._result_cache = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @staticmethod
+    def _to_float(fundamental, column):
+        if fundamental is None or fundamental.get(column) is None:
+            return np.nan
+
+        try:
+            return float(fundamental[column])
+        except ValueError:
+            return np.nan
+
+    def _compile(self, expression):
+        """
+        Check that expression only uses columns, numbers and arithmetic/comparison
+        operators, then compile it.  Anything else raises BadArgument.
+        """
+
+        if expression in self._expression_cache:
+            return self._expression_cache[expression]
+
+        try:
+            tree = ast.parse(expression, mode='eval')
+        except (SyntaxError, ValueError):
+            raise BadArgument()
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name):
+                if node.id not in self.columns:
+                    raise BadArgument()
+            elif isinstance(node, SCREENER_CONSTANT_NODE):
+                if type(getattr(node, 'value', getattr(node, 'n', None))) not in (int, float, bool):
+                    raise BadArgument()
+            elif isinstance(node, ast.Compare):
+                # Chained comparisons (a < b < c) use "and" under the hood, which
+                # doesn't work element-wise.
+                if len(node.ops) != 1:
+                    raise BadArgument()
+            elif not isinstance(node, SCREENER_ALLOWED_NODES):
+                raise BadArgument()
+
+        code_object = compile(tree, "<screen>", "eval")
+        self._expression_cache[expression] = code_object
+
+        return code_object
+
+    def evaluate(self, expression):
+        """
+        Evaluate expression across the whole universe and return the resulting
+        array (one element per instrument).
+        """
+
+        key = ('evaluate', expression)
+        if key not in self._result_cache:
+            code_object = self._compile(expression)
+
+            # Expressions that pass validation can still be nonsense for the column
+            # types, e.g. ~market_cap on floats.
+            try:
+                with np.errstate(all='ignore'):
+                    result = eval(code_object, {'__builtins__' : {}}, self.columns)
+            except Exception:
+                raise BadArgument()
+
+            self._result_cache[key] = np.broadcast_to(result, self.symbols.shape)
+
+        return self._result_cache[key]
+
+    def filter(self, expression):
+        """
+        Return the indices of the instruments for which expression is True.
+        """
+
+        key = ('filter', expression)
+        if key not in self._result_cache:
+            result = self.evaluate(expression)
+
+            # A bare column like "market_cap" would otherwise let NaN rows through,
+            # since NaN is truthy.
+            if result.dtype.kind == 'f':
+                result = np.nan_to_num(result, nan=0.0)
+
+            self._result_cache[key] = np.flatnonzero(result)
+
+        return self._result_cache[key]
+
+    def rank(self, expression, descending = True):
+        """
+        Return instrument indices ordered by the value of expression.  NaNs always
+        sort last.
+        """
+
+        key = ('rank', expression, descending)
+        if key not in self._result_cache:
+            values = self.evaluate(expression).astype(np.float64)
+
+            if descending:
+                values = -values
+
+            # argsort puts NaNs at the end regardless of sign
+            self._result_cache[key] = np.argsort(values, kind='mergesort')
+
+        return self._result_cache[key]
+
+    def screen(self, filter_expression = None, rank = None, descending = True, limit = None):
+        """
+        Return the symbols passing filter_expression, optionally ordered by the
+        rank expression and truncated to limit results.
+        """
+
+        if filter_expression is None:
+            indices = np.arange(len(self.symbols))
+        else:
+            indices = self.filter(filter_expression)
+
+        if rank is not None:
+            order = self.rank(rank, descending)
+
+            # Keep the rank order, but only for instruments that passed the filter
+            selected = np.zeros(len(self.symbols), dtype=bool)
+            selected[indices] = True
+            indices = order[selected[order]]
+
+        if limit is not None:
+            indices = indices[:limit]
+
+        return self.symbols[indices]
+
+    def clear_cache(self):
+        self._result_cache.clear()
+
+# ----------------------------------------------------------------------------- #
+# Response Cache                                                                #
+# ----------------------------------------------------------------------------- #
+
+class ResponseCache:
+    """
+    Cache for GET responses from read only endpoints.
+
+    Entries are keyed on the URL and the session's auth token, and remember the
+    ETag/Last-Modified headers that came back with the response.  Every lookup
+    still goes to the API, but as a conditional request: if the server answers
+    304 Not Modified, the previously parsed json is returned without downloading
+    or parsing the body again.
+
+    Entries live in an in-memory LRU bounded by max_entries and max_bytes (of
+    response body).  If cache_directory is given, entries are also written to
+    disk so they survive restarts; the disk copy is its own LRU bounded by
+    disk_max_entries and disk_max_bytes.  Anything not revalidated within max_age
+    seconds is dropped.
+
+    Note: The json returned on a hit is the same object that was returned the
+    first time, so don't modify it.
+    """
+
+    def __init__(self, max_entries = RESPONSE_CACHE_MAX_ENTRIES, max_bytes = RESPONSE_CACHE_MAX_BYTES,
+                 max_age = RESPONSE_CACHE_MAX_AGE, cache_directory = None,
+                 disk_max_entries = RESPONSE_CACHE_DISK_MAX_ENTRIES, disk_max_bytes = RESPONSE_CACHE_DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.cache_directory = cache_directory
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+
+        # key -> dict(url, etag, last_modified, validated_at, size, data)
+        self._entries = collections.OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        # key -> size of the file on disk, least recently used first
+        self._disk_entries = collections.OrderedDict()
+        self._disk_bytes = 0
+
+        if self.cache_directory is not None:
+            try:
+                os.makedirs(self.cache_directory)
+            except OSError:
+                if not os.path.isdir(self.cache_directory):
+                    raise
+
+            self._load_disk_index()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _get_key(session, url):
+        token = getattr(session, 'headers', {}).get('Authorization', '')
+        return hashlib.sha1(("%s\n%s" % (token, url)).encode('utf-8')).hexdigest()
+
+    def _get_disk_path(self, key):
+        return os.path.join(self.cache_directory, "%s.json" % key)
+
+    def get_json(self, session, url):
+        """
+        GET url with session (a requests session or the requests module itself)
+        and return the parsed json, revalidating against the cache.
+        """
+
+        key = ResponseCache._get_key(session, url)
+
+        with self._lock:
+            entry = self._get_entry(key)
+
+        headers = {}
+        if entry is not None:
+            if entry['etag'] is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        start_time = time.time()
+        response = session.get(url, headers = headers)
+        log_request("GET", url, response.status_code, time.time() - start_time)
+
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.hits += 1
+                entry['validated_at'] = time.time()
+
+                # The file's modification time is its validated_at, so that
+                # revalidations survive a restart.
+                if key in self._disk_entries:
+                    try:
+                        os.utime(self._get_disk_path(key), (entry['validated_at'], entry['validated_at']))
+                    except OSError:
+                        self._remove_disk_entry(key)
+
+            return entry['data']
+
+        data = json.loads(response.text)
+
+        with self._lock:
+            self.misses += 1
+
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+            if response.status_code == 200 and (etag is not None or last_modified is not None):
+                entry = {
+                        'url'           : url,
+                        'etag'          : etag,
+                        'last_modified' : last_modified,
+                        'validated_at'  : time.time(),
+                        'size'          : len(response.content),
+                        'data'          : data
+                        }
+
+                self._put_entry(key, entry)
+
+                # Entries too big for the in-memory cache aren't kept on disk either
+                if self.cache_directory is not None and key in self._entries:
+                    self._write_disk_entry(key, entry, response.text)
+
+        return data
+
+    def _get_entry(self, key):
+        """
+        Look up key in memory, then on disk.  Must be called with the lock held.
+        """
+
+        entry = self._entries.get(key)
+
+        if entry is None:
+            if key not in self._disk_entries:
+                return None
+
+            entry = self._read_disk_entry(key)
+            if entry is None or time.time() - entry['validated_at'] > self.max_age:
+                self._remove_disk_entry(key)
+                return None
+
+            self._put_entry(key, entry)
+            return entry
+
+        if time.time() - entry['validated_at'] > self.max_age:
+            self._remove_entry(key)
+            return None
+
+        # Mark as most recently used
+        self._entries[key] = self._entries.pop(key)
+
+        return entry
+
+    def _put_entry(self, key, entry):
+        if key in self._entries:
+            self._remove_entry(key, from_disk = False)
+
+        # Don't flush every warm entry to make room for one that can't fit anyway
+        if entry['size'] > self.max_bytes:
+            return
+
+        self._entries[key] = entry
+        self._total_bytes += entry['size']
+
+        while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+            self._remove_entry(next(iter(self._entries)), from_disk = False)
+            self.evictions += 1
+
+    def _remove_entry(self, key, from_disk = True):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry['size']
+
+        if from_disk:
+            self._remove_disk_entry(key)
+
+    # ------------------------------------------------------------------------- #
+    # Disk Storage                                                              #
+    # ------------------------------------------------------------------------- #
+
+    def _load_disk_index(self):
+        """
+        Build the disk LRU from whatever an earlier run left in cache_directory,
+        oldest modification time first.
+        """
+
+        disk_files = []
+        for file_name in os.listdir(self.cache_directory):
+            if not file_name.endswith(".json"):
+                continue
+
+            try:
+                file_stat = os.stat(os.path.join(self.cache_directory, file_name))
+            except OSError:
+                continue
+
+            disk_files.append((file_stat.st_mtime, file_name[:-len(".json")], file_stat.st_size))
+
+        for _, key, size in sorted(disk_files):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+
+        self._trim_disk()
+
+    def _trim_disk(self):
+        while len(self._disk_entries) > self.disk_max_entries or self._disk_bytes > self.disk_max_bytes:
+            self._remove_disk_entry(next(iter(self._disk_entries)))
+            self.evictions += 1
+
+    def _remove_disk_entry(self, key):
+        size = self._disk_entries.pop(key, None)
+        if size is None:
+            return
+
+        self._disk_bytes -= size
+
+        try:
+            os.remove(self._get_disk_path(key))
+        except OSError:
+            pass
+
+    def _read_disk_entry(self, key):
+        disk_path = self._get_disk_path(key)
+
+        try:
+            with open(disk_path, "r") as infile:
+                disk_entry = json.load(infile)
+
+            disk_entry['validated_at'] = os.path.getmtime(disk_path)
+        except (IOError, OSError, ValueError):
+            return None
+
+        disk_entry['data'] = json.loads(disk_entry.pop('body'))
+
+        # Mark as most recently used
+        self._disk_entries[key] = self._disk_entries.pop(key)
+
+        return disk_entry
+
+    def _write_disk_entry(self, key, entry, body):
+        disk_entry = dict((field, value) for field, value in entry.items() if field not in ('data', 'validated_at'))
+        disk_entry['body'] = body
+
+        disk_path = self._get_disk_path(key)
+        temporary_path = "%s.tmp" % disk_path
+        with open(temporary_path, "w") as outfile:
+            json.dump(disk_entry, outfile)
+        os.rename(temporary_path, disk_path)
+
+        if key in self._disk_entries:
+            self._disk_bytes -= self._disk_entries.pop(key)
+
+        self._disk_entries[key] = os.path.getsize(disk_path)
+        self._disk_bytes += self._disk_entries[key]
+
+        self._trim_disk()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries.keys()):
+                self._remove_entry(key)
+
+            for key in list(self._disk_entries.keys()):
+                self._remove_disk_entry(key)
+
+    def get_stats(self):
+        """
+        Returns a dict with hit/miss/eviction counts, the hit rate and the current
+        size of the in-memory and on-disk caches.
+        """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                    'hits'          : self.hits,
+                    'misses'        : self.misses,
+                    'evictions'     : self.evictions,
+                    'hit_rate'      : float(self.hits) / lookups if lookups > 0 else 0.0,
+                    'entries'       : len(self._entries),
+                    'bytes'         : self._total_bytes,
+                    'disk_entries'  : len(self._disk_entries),
+                    'disk_bytes'    : self._disk_bytes
+                    }
+
+# ----------------------------------------------------------------------------- #
+# User Profile                                                                  #
+# ----------------------------------------------------------------------------- #
+
+class UserProfile:
+    """
+    Consolidated view of the logged in user's user, basic info, employment and
+    investment profile data.
+
+    All four endpoints are fetched concurrently the first time any field is asked
+    for.  The combined result is kept for ttl seconds, after which the next lookup
+    fetches everything again.
+    """
+
+    def __init__(self, robinhood_instance, ttl = USER_PROFILE_TTL):
+        self.robinhood_instance = robinhood_instance
+        self.ttl = ttl
+
+        self._profile_data = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _get_section(self, section):
+        with self._lock:
+            if self._profile_data is None or time.time() - self._fetched_at > self.ttl:
+                self._profile_data = self._fetch()
+                self._fetched_at = time.time()
+
+            return self._profile_data[section]
+
+    def _fetch(self):
+        if not self.robinhood_instance.is_logged_in():
+            raise NotLoggedIn()
+
+        login_session = self.robinhood_instance.login_session
+
+        with ThreadPoolExecutor(max_workers = len(USER_PROFILE_ENDPOINTS)) as executor:
+            futures = dict((section, executor.submit(RobinhoodInstance.get_json, API_URLS[endpoint], login_session))
+                           for section, endpoint in USER_PROFILE_ENDPOINTS.items())
+
+        return dict((section, future.result()) for section, future in futures.items())
+
+    def _lookup(self, section, param):
+        response = self._get_section(section)
+
+        if param == GET_ALL:
+            return response
+        elif param in response.keys():
+            return response[param]
+        else:
+            raise BadArgument()
+
+    def invalidate(self):
+        """
+        Drop the cached profile so the next lookup goes back to the API.
+        """
+
+        with self._lock:
+            self._profile_data = None
+
+    def get_user_data(self, param):
+        return self._lookup(GET_USER, param)
+
+    def get_basic_user_info(self, param):
+        return self._lookup(GET_BASIC_INFO, param)
+
+    def get_employment_data(self, param):
+        return self._lookup(GET_EMPLOYMENT, param)
+
+    def get_investment_profile_data(self, param):
+        return self._lookup(GET_INVESTMENT_PROFILE, param)
+
+# ----------------------------------------------------------------------------- #
+# Options Chains                                                                #
+# ----------------------------------------------------------------------------- #
+
+class OptionsChain:
+    """
+    Columnar snapshot of one underlying's options chain.
+
+    Each column (url, expiry, option_type, strike and the quote columns from
+    OPTIONS_QUOTE_FIELDS) is a numpy array with one element per contract.  Rows
+    are sorted by expiry, then type (calls before puts), then strike, so every
+    expiry/type pair is one contiguous block and strikes within it can be found
+    with a binary search.  get_expiry returns views into the columns, not copies.
+
+    expiry is datetime64[D], option_type is OPTION_CALL or OPTION_PUT and quote
+    fields the API didn't fill in are NaN.
+    """
+
+    def __init__(self, symbol, columns, fetched_at, sort = True):
+        self.symbol = symbol
+        self.fetched_at = fetched_at
+
+        if sort:
+            order = np.lexsort((columns['strike'], columns['option_type'], columns['expiry']))
+            columns = dict((name, column[order]) for name, column in columns.items())
+
+        self.columns = columns
+        for name, column in columns.items():
+            setattr(self, name, column)
+
+        # Index of expiry/type blocks: rows of block (expiry i, type t) are
+        # block_offsets[2 * i + t] up to block_offsets[2 * i + t + 1]
+        self.expirations, expiry_index = np.unique(self.expiry, return_inverse=True)
+        block_key = 2 * expiry_index.astype(np.int64) + self.option_type
+        self._block_offsets = np.searchsorted(block_key, np.arange(2 * len(self.expirations) + 1))
+
+    def __len__(self):
+        return len(self.strike)
+
+    def _view(self, start, stop):
+        return OptionsChain(self.symbol, dict((name, column[start:stop]) for name, column in self.columns.items()),
+                            self.fetched_at, sort = False)
+
+    def get_expiry(self, expiry, option_type = None, low_strike = None, high_strike = None):
+        """
+        Return the contracts expiring on expiry (a datetime64 or "YYYY-MM-DD"),
+        optionally limited to one option_type and to strikes in
+        [low_strike, high_strike].  The result is an OptionsChain of views.
+        """
+
+        expiry_position = np.searchsorted(self.expirations, np.datetime64(expiry, 'D'))
+        if expiry_position == len(self.expirations) or self.expirations[expiry_position] != np.datetime64(expiry, 'D'):
+            return self._view(0, 0)
+
+        if option_type is None:
+            # Strikes are only sorted within a single type, so a strike range
+            # needs option_type as well.
+            if low_strike is not None or high_strike is not None:
+                raise BadArgument()
+
+            return self._view(self._block_offsets[2 * expiry_position], self._block_offsets[2 * expiry_position + 2])
+
+        block = 2 * expiry_position + option_type
+        start = self._block_offsets[block]
+        stop = self._block_offsets[block + 1]
+
+        strikes = self.strike[start:stop]
+        if low_strike is not None:
+            start = start + np.searchsorted(strikes, low_strike, side='left')
+        if high_strike is not None:
+            stop = self._block_offsets[block] + np.searchsorted(strikes, high_strike, side='right')
+
+        return self._view(start, max(start, stop))
+
+
+class OptionsChainFetcher:
+    """
+    Fetches options chains for the logged in user.
+
+    Fetching happens in three concurrent phases across every requested underlying:
+    resolve each chain (id and expiration dates), pull the contracts for every
+    expiration, then pull quotes and greeks for every contract in batches.  All
+    three share one bounded thread pool.
+
+    Chain metadata (chain ids, expirations and contracts) is cached for
+    metadata_ttl seconds and quotes for quote_ttl seconds.
+    """
+
+    def __init__(self, robinhood_instance, max_workers = OPTIONS_MAX_WORKERS,
+                 metadata_ttl = OPTIONS_METADATA_TTL, quote_ttl = OPTIONS_QUOTE_TTL):
+        self.robinhood_instance = robinhood_instance
+        self.max_workers = max_workers
+        self.metadata_ttl = metadata_ttl
+        self.quote_ttl = quote_ttl
+
+        # symbol -> (fetched_at, contracts dict of columns)
+        self._metadata_cache = {}
+        # symbol -> OptionsChain
+        self._chain_cache = {}
+        self._lock = threading.Lock()
+
+    def get_chains(self, symbols):
+        """
+        Returns a dict mapping each symbol to its OptionsChain.
+        """
+
+        if not self.robinhood_instance.is_logged_in():
+            raise NotLoggedIn()
+
+        now = time.time()
+        chains = {}
+
+        with self._lock:
+            for symbol in symbols:
+                chain = self._chain_cache.get(symbol)
+                if chain is not None and now - chain.fetched_at <= self.quote_ttl:
+                    chains[symbol] = chain
+
+            stale_symbols = [symbol for symbol in symbols if symbol not in chains]
+            metadata = dict((symbol, self._metadata_cache[symbol][1]) for symbol in stale_symbols
+                            if symbol in self._metadata_cache and now - self._metadata_cache[symbol][0] <= self.metadata_ttl)
+
+        if len(stale_symbols) == 0:
+            return chains
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            missing_symbols = [symbol for symbol in stale_symbols if symbol not in metadata]
+            if len(missing_symbols) > 0:
+                fetched_metadata, complete_symbols = self._fetch_metadata(executor, missing_symbols)
+                metadata.update(fetched_metadata)
+
+                # Failed lookups aren't cached, so a transient error doesn't leave a
+                # symbol with an empty or partial chain for the whole metadata_ttl.
+                with self._lock:
+                    for symbol in complete_symbols:
+                        self._metadata_cache[symbol] = (now, fetched_metadata[symbol])
+
+            quotes = self._fetch_quotes(executor, [url for symbol in stale_symbols for url in metadata[symbol]['url']])
+
+        fetched_at = time.time()
+
+        with self._lock:
+            for symbol in stale_symbols:
+                columns = dict(metadata[symbol])
+
+                for field, column in OPTIONS_QUOTE_FIELDS:
+                    columns[column] = np.array([OptionsChainFetcher._to_float(quotes.get(url), field)
+                                                for url in columns['url']], dtype=np.float64)
+
+                chains[symbol] = self._chain_cache[symbol] = OptionsChain(symbol, columns, fetched_at)
+
+        return chains
+
+    @staticmethod
+    def _to_float(quote, field):
+        if quote is None or quote.get(field) is None:
+            return np.nan
+
+        return float(quote[field])
+
+    def _fetch_metadata(self, executor, symbols):
+        """
+        Resolve the chain for every symbol and fetch the contracts of all of its
+        expirations.  Returns symbol -> dict of contract columns, along with the set
+        of symbols whose chain resolved and whose contracts all came back.
+        """
+
+        login_session = self.robinhood_instance.login_session
+
+        def get_chain(symbol):
+            instrument_id = RobinhoodInstance.get_instrument_id(symbol)
+            if instrument_id is False:
+                return None
+
+            chain_data = RobinhoodInstance.get_json(API_URLS['options-chains'] + "?equity_instrument_ids=%s" % instrument_id, login_session)
+            if "results" not in chain_data.keys() or len(chain_data["results"]) == 0:
+                return None
+
+            # Adjusted chains (after splits and the like) show up alongside the
+            # regular one.  Prefer the chain that can still be traded.
+            for chain in chain_data["results"]:
+                if chain.get("can_open_position") is True:
+                    return chain
+
+            return chain_data["results"][0]
+
+        def get_contracts(chain_id, expiration_date):
+            """
+            Returns the contracts for one expiration and whether every page of
+            them came back.  An error response (e.g. rate limiting) ends the
+            pagination rather than failing the whole call.
+            """
+
+            contracts = []
+            next_url = API_URLS['options-instruments'] + "?chain_id=%s&expiration_dates=%s&state=active&tradability=tradable" % (chain_id, expiration_date)
+
+            while next_url is not None:
+                contract_data = RobinhoodInstance.get_json(next_url, login_session)
+                if "results" not in contract_data.keys():
+                    return contracts, False
+
+                contracts = contracts + contract_data["results"]
+                next_url = contract_data.get("next")
+
+            return contracts, True
+
+        chains = dict(zip(symbols, executor.map(get_chain, symbols)))
+
+        futures = dict(((symbol, expiration_date), executor.submit(get_contracts, chain["id"], expiration_date))
+                       for symbol, chain in chains.items() if chain is not None
+                       for expiration_date in chain["expiration_dates"])
+
+        metadata = {}
+        complete_symbols = set(symbol for symbol, chain in chains.items() if chain is not None)
+
+        for symbol in symbols:
+            contracts = []
+            for (contract_symbol, _), future in futures.items():
+                if contract_symbol != symbol:
+                    continue
+
+                expiration_contracts, complete = future.result()
+                contracts = contracts + expiration_contracts
+
+                if not complete:
+                    complete_symbols.discard(symbol)
+
+            metadata[symbol] = {
+                    'url'           : np.array([contract["url"] for contract in contracts], dtype=object),
+                    'expiry'        : np.array([contract["expiration_date"] for contract in contracts], dtype='datetime64[D]'),
+                    'option_type'   : np.array([OPTION_CALL if contract["type"] == "call" else OPTION_PUT
+                                                for contract in contracts], dtype=np.int8),
+                    'strike'        : np.array([float(contract["strike_price"]) for contract in contracts], dtype=np.float64)
+                    }
+
+        return metadata, complete_symbols
+
+    def _fetch_quotes(self, executor, instrument_urls):
+        """
+        Fetch market data for every instrument url, OPTIONS_QUOTE_BATCH_SIZE at a
+        time.  Returns instrument url -> quote dict.
+        """
+
+        login_session = self.robinhood_instance.login_session
+
+        # Quotes change constantly, so these skip the response cache.
+        def get_batch(batch):
+            start_time = time.time()
+            response = login_session.get(API_URLS['options-marketdata'], params = {'instruments' : ",".join(batch)})
+            log_request("GET", API_URLS['options-marketdata'], response.status_code, time.time() - start_time)
+
+            quote_data = json.loads(response.text)
+            if "results" not in quote_data.keys():
+                return []
+
+            return [quote for quote in quote_data["results"] if quote is not None]
+
+        batches = [instrument_urls[index:index + OPTIONS_QUOTE_BATCH_SIZE]
+                   for index in range(0, len(instrument_urls), OPTIONS_QUOTE_BATCH_SIZE)]
+
+        return dict((quote["instrument"], quote) for batch_quotes in executor.map(get_batch, batches)
+                    for quote in batch_quotes)
+
 # ----------------------------------------------------------------------------- #
 # RobinhoodInstance Class                                                       #
 # ----------------------------------------------------------------------------- #
 
 class RobinhoodInstance:
+    # Shared cache for read only GET requests.  None disables caching.  See
+    # enable_response_cache.
+    response_cache = None
+
     def __init__(self):
         self.logged_in = False
         self.login_token = ""
 
-        self.username = None
-        self.password = None
+        self.username = None
+        self.password = None
+
+        self.login_session = None
+
+        self.user_profile = None
+        self.options_chain_fetcher = None
+
+
+    # ------------------------------------------------------------------------- #
+    # Response Caching                                                          #
+    # ------------------------------------------------------------------------- #
+
+    @staticmethod
+    def enable_response_cache(response_cache = None):
+        """
+        Turn on conditional-request caching for the read only endpoints (instruments,
+        user, basic_info, investment_profile and positions).  Pass a ResponseCache to
+        control its limits or disk storage; otherwise an in-memory one is created.
+
+        Returns the cache so that its stats can be checked with get_stats().
+        """
+
+        if response_cache is None:
+            response_cache = ResponseCache()
+
+        RobinhoodInstance.response_cache = response_cache
+
+        return response_cache
+
+    @staticmethod
+    def disable_response_cache():
+        RobinhoodInstance.response_cache = None
+
+    @staticmethod
+    def get_json(url, session = requests):
+        """
+        GET url and return the parsed json, going through the response cache if one
+        is enabled.  session defaults to the requests module for calls that don't
+        need to be logged in.
+        """
+
+        if RobinhoodInstance.response_cache is not None:
+            return RobinhoodInstance.response_cache.get_json(session, url)
 
-        self.login_session = None
+        start_time = time.time()
+        response = session.get(url)
+        log_request("GET", url, response.status_code, time.time() - start_time)
 
+        return json.loads(response.text)
 
     # ------------------------------------------------------------------------- #
     # Login/Authentication Functions                                            #
@@ -248,6 +1684,8 @@ class RobinhoodInstance:
             else:
                 self.login_token = response['token']
                 self.login_session.__dict__['headers'].update({'Authorization' : 'Token %s' % self.login_token})
+                self.user_profile = None
+                self.options_chain_fetcher = None
         else:
             # See if the user has defined a file with their username and password.
             # If not, prompt them on the command line for it.
@@ -294,6 +1732,8 @@ class RobinhoodInstance:
             else:
                 self.login_token = response['token']
                 self.login_session.__dict__['headers'].update({'Authorization' : 'Token %s' % self.login_token})
+                self.user_profile = None
+                self.options_chain_fetcher = None
 
 
     def get_login_credentials(self):
@@ -326,6 +1766,8 @@ class RobinhoodInstance:
 
         self.login_session = None
         self.login_token = None
+        self.user_profile = None
+        self.options_chain_fetcher = None
 
 
     def reset_password(self, new_password = ""):
@@ -350,10 +1792,53 @@ class RobinhoodInstance:
     # ------------------------------------------------------------------------- #
 
     def get_fundamentals_singleton(self, ticker_symbol):
-        pass
+        """
+        Returns the json dict of fundamentals (market_cap, volume, pe_ratio, etc.)
+        for a single ticker, or None if the API has nothing for it.
+        """
+
+        return self.get_fundamentals_multiple([ticker_symbol])[0]
 
     def get_fundamentals_multiple(self, list_of_tickers):
-        pass
+        """
+        Returns a list of fundamentals json dicts in the same order as list_of_tickers.
+        Tickers that the API doesn't know about come back as None.
+
+        The API only takes FUNDAMENTALS_BATCH_SIZE symbols per request, so the list
+        is split into batches which are fetched concurrently.
+        """
+
+        batches = [list_of_tickers[index:index + FUNDAMENTALS_BATCH_SIZE]
+                   for index in range(0, len(list_of_tickers), FUNDAMENTALS_BATCH_SIZE)]
+
+        def get_batch(batch):
+            start_time = time.time()
+            response = requests.get(API_URLS['fundamentals'], params = {'symbols' : ",".join(batch)})
+            log_request("GET", API_URLS['fundamentals'], response.status_code, time.time() - start_time)
+            fundamentals_data = json.loads(response.text)
+
+            if "results" not in fundamentals_data.keys():
+                return [None] * len(batch)
+
+            return fundamentals_data["results"]
+
+        with ThreadPoolExecutor(max_workers = FUNDAMENTALS_MAX_WORKERS) as executor:
+            results = list(executor.map(get_batch, batches))
+
+        return [fundamental for batch_results in results for fundamental in batch_results]
+
+    def get_universe_screener(self, instruments = None):
+        """
+        Build a UniverseScreener over every instrument in instruments (defaults to
+        the full output of get_all_instruments) along with its fundamentals.
+        """
+
+        if instruments is None:
+            instruments = RobinhoodInstance.get_all_instruments(output_file = None)
+
+        fundamentals = self.get_fundamentals_multiple([instrument["symbol"] for instrument in instruments])
+
+        return UniverseScreener(instruments, fundamentals)
 
     # ------------------------------------------------------------------------- #
     # Buy Orders                                                                #
@@ -387,7 +1872,9 @@ class RobinhoodInstance:
                 'side'          : 'buy'
                 }
                 
+        start_time = time.time()
         response = self.login_session.post(API_URLS['order'], data=data_dict)
+        log_request("POST", API_URLS['order'], response.status_code, time.time() - start_time, sampled = False)
         
         buy_order_response = json.loads(response.text)
 
@@ -395,8 +1882,8 @@ class RobinhoodInstance:
         if len(buy_order_response) < 3:
             # Try to print out the error response code.  If you can't, that's ok.
             try:
-                print_logger.error("[ERROR]: Buy order failed: %s" % buy_order_response["detail"])
-            except NameError:
+                print_logger.error("[ERROR]: Buy order failed: %s", buy_order_response["detail"])
+            except KeyError:
                 print_logger.error("[ERROR]: Buy order failed.")
 
             return False
@@ -435,7 +1922,9 @@ class RobinhoodInstance:
                 'side'          : 'sell'
                 }
                 
+        start_time = time.time()
         response = self.login_session.post(API_URLS['order'], data=data_dict)
+        log_request("POST", API_URLS['order'], response.status_code, time.time() - start_time, sampled = False)
 
         sell_order_response = json.loads(response.text)
 
@@ -443,14 +1932,10 @@ class RobinhoodInstance:
         if len(sell_order_response) < 3:
             # Try to print out the error response code.  If you can't, that's ok.
             try:
-                print_logger.error("[ERROR]: Sell order failed: %s" % sell_order_response["detail"])
-
-                import code; code.interact(local=locals())
-            except NameError:
+                print_logger.error("[ERROR]: Sell order failed: %s", sell_order_response["detail"])
+            except KeyError:
                 print_logger.error("[ERROR]: Sell order failed.")
 
-            import code; code.interact(local=locals())
-
             return False
         else:
             return sell_order_response
@@ -469,18 +1954,14 @@ class RobinhoodInstance:
         """
 
         json_result = None
-        response = requests.get(API_URLS["instrument"])
-
-        next_object = json.loads(response.text)
+        next_object = RobinhoodInstance.get_json(API_URLS["instrument"])
         stocks_list = next_object["results"]
 
         while True:
-            if "unicode" not in str(type(next_object["next"])):
+            if next_object["next"] is None:
                 break
 
-            response = requests.get(next_object["next"])
-
-            next_object = json.loads(response.text)
+            next_object = RobinhoodInstance.get_json(next_object["next"])
             stocks_list = stocks_list + next_object["results"]
 
         if output_file is not None:
@@ -504,20 +1985,75 @@ class RobinhoodInstance:
         this class.
         """
 
-        response = requests.get(API_URLS["instrument"] + "?symbol=%s" % ticker_symbol)
-
         # Check to make sure that the keys that we need are in the output json.
         # I don't want any of these commands to throw exceptions because of bad data
         # and potentially kill the program.
-        instrument_data = json.loads(response.text)
+        instrument_data = RobinhoodInstance.get_json(API_URLS["instrument"] + "?symbol=%s" % ticker_symbol)
 
-        if "results" in instrument_data.keys():
+        if "results" in instrument_data.keys() and len(instrument_data["results"]) > 0:
             if "id" in instrument_data["results"][0].keys():
                 return instrument_data["results"][0]["id"]
 
         # If we get here, something bad happened.
         return False
 
+    # ------------------------------------------------------------------------- #
+    # Historical Price Data                                                     #
+    # ------------------------------------------------------------------------- #
+
+    @staticmethod
+    def get_historicals(symbols, interval, span, cache_directory = HISTORICALS_CACHE_DIRECTORY_PATH):
+        """
+        Return historical OHLCV bars for every symbol in symbols.
+
+        interval is one of the keys of INTERVAL_SECONDS ("5minute", "10minute", "hour",
+        "day", "week") and span is one of "day", "week", "month", "3month", "year" or
+        "5year".
+
+        Returns a dict mapping each symbol to a read only BAR_DTYPE array memory-mapped
+        from the local cache (see HistoricalBarCache).  Symbols are fetched concurrently
+        and only bars missing from the cache are downloaded.
+
+        Note: Like get_instrument_id, this can be called without being logged in.
+        """
+
+        if isinstance(symbols, str):
+            symbols = [symbols]
+
+        bar_cache = HistoricalBarCache(cache_directory)
+
+        with ThreadPoolExecutor(max_workers = HISTORICALS_MAX_WORKERS) as executor:
+            futures = dict((symbol, executor.submit(bar_cache.get, symbol, interval, span)) for symbol in symbols)
+
+        return dict((symbol, future.result()) for symbol, future in futures.items())
+
+    # ------------------------------------------------------------------------- #
+    # Options Chains                                                            #
+    # ------------------------------------------------------------------------- #
+
+    def get_options_chain(self, ticker_symbol):
+        """
+        Returns the OptionsChain (every active contract with quotes and greeks) for
+        a single underlying.
+        """
+
+        return self.get_options_chains([ticker_symbol])[ticker_symbol]
+
+    def get_options_chains(self, list_of_tickers):
+        """
+        Returns a dict mapping each ticker to its OptionsChain.  All underlyings,
+        expirations and quote batches are fetched concurrently; see
+        OptionsChainFetcher for the caching rules.
+        """
+
+        if not self.is_logged_in():
+            raise NotLoggedIn()
+
+        if self.options_chain_fetcher is None:
+            self.options_chain_fetcher = OptionsChainFetcher(self)
+
+        return self.options_chain_fetcher.get_chains(list_of_tickers)
+
     # ------------------------------------------------------------------------- #
     # Account Helper Functions                                                  #
     # ------------------------------------------------------------------------- #
@@ -596,7 +2132,9 @@ class RobinhoodInstance:
 
         # Making an API call here with post was rejected by the API server.  Curl
         # should work where post failed.
+        start_time = time.time()
         response = self.login_session.get(API_URLS['accounts'])
+        log_request("GET", API_URLS['accounts'], response.status_code, time.time() - start_time)
 
         # The result returned by curl is a string.  Cast this to a json dict
         
@@ -613,6 +2151,26 @@ class RobinhoodInstance:
     # User Information Helper Functions                                         #
     # ------------------------------------------------------------------------- #
 
+    def get_user_profile(self, ttl = None):
+        """
+        Returns the UserProfile for the logged in user.  The user, basic info,
+        employment and investment profile getters below all read from it, so
+        asking for several fields only costs one round of (concurrent) requests.
+
+        Passing ttl changes how long the profile is kept before it is fetched
+        again.  Otherwise the current setting (USER_PROFILE_TTL by default) is kept.
+        """
+
+        if not self.is_logged_in():
+            raise NotLoggedIn()
+
+        if self.user_profile is None:
+            self.user_profile = UserProfile(self, USER_PROFILE_TTL if ttl is None else ttl)
+        elif ttl is not None:
+            self.user_profile.ttl = ttl
+
+        return self.user_profile
+
     def get_user_data(self, param):
         """
         Query the API for all data associated with the logged in user's account.
@@ -637,19 +2195,7 @@ class RobinhoodInstance:
         if not self.is_logged_in():
             raise NotLoggedIn()
 
-        # Making an API call here with post was rejected by the API server.  Curl
-        # should work where post failed.
-        response = self.login_session.get(API_URLS['user-info'])
-
-        # The result returned by curl is a string.  Cast this to a json dict
-        response = json.loads(response.text)
-
-        if param == GET_ALL:
-            return response
-        elif param in response.keys():
-            return response[param]
-        else:
-            raise BadArgument()
+        return self.get_user_profile().get_user_data(param)
 
     def get_basic_user_info(self, param):
         """
@@ -671,18 +2217,9 @@ class RobinhoodInstance:
         """
 
         if not self.is_logged_in():
-            return NotLoggedIn()
-
-        response = self.login_session.get(API_URLS['basic-info'])
-
-        response = json.loads(response.text)
+            raise NotLoggedIn()
 
-        if param == GET_ALL:
-            return response
-        elif param in response.keys():
-            return response[param]
-        else:
-            raise BadArgument()
+        return self.get_user_profile().get_basic_user_info(param)
 
     def get_affiliation_information(self, param):
         """
@@ -712,16 +2249,7 @@ class RobinhoodInstance:
         if not self.is_logged_in():
             raise NotLoggedIn()
 
-        response = self.login_session.get(API_URLS['employment-info'])
-
-        response = json.loads(response.text)
-
-        if param == GET_ALL:
-            return response
-        elif param in response.keys():
-            return response[param]
-        else:
-            raise BadArgument()
+        return self.get_user_profile().get_employment_data(param)
 
     def get_investment_profile_data(self, param):
         """
@@ -746,16 +2274,7 @@ class RobinhoodInstance:
         if not self.is_logged_in():
             raise NotLoggedIn()
 
-        response = self.login_session.get(API_URLS['investment-profile'])
-
-        response = json.loads(response.text)
-
-        if param == GET_ALL:
-            return response
-        elif param in response.keys():
-            return response[param]
-        else:
-            raise BadArgument()
+        return self.get_user_profile().get_investment_profile_data(param)
 
     # ------------------------------------------------------------------------- #
     # Position Information                                                      #
@@ -788,15 +2307,479 @@ class RobinhoodInstance:
         
         account_id = self.get_account_data(GET_ACCOUNT_NUMBER)
         
-        response = self.login_session.get(API_URLS['positions'] % account_id)
-        
-        response = json.loads(response.text)
+        response = RobinhoodInstance.get_json(API_URLS['positions'] % account_id, self.login_session)
         
         if active is True:
             return [position for position in response["results"] if float(position["quantity"]) != 0.0]
         else:
             return response
 
+# ----------------------------------------------------------------------------- #
+# PaperTradingInstance Class                                                    #
+# ----------------------------------------------------------------------------- #
+
+class PaperTradingInstance:
+    """
+    Simulated broker that can be used in place of RobinhoodInstance for backtesting.
+
+    buy_order, sell_order, get_account_data and get_position_history take the same
+    arguments and return the same shapes of data as their RobinhoodInstance
+    counterparts, but orders are filled against replayed historical bars instead
+    of being sent to the API.
+
+    Fill model:
+      - Market orders fill immediately at the close of the current bar.
+      - Limit orders that are marketable against the current close fill there
+        immediately.  Otherwise they rest and are checked against each following
+        bar: buys fill if the bar's low reaches the limit, sells if the high does,
+        at the bar's open if that is better than the limit.
+      - Buy limit orders hold cash and sell limit orders hold shares until they
+        fill or are cancelled.  "gfd" orders are cancelled when the day changes,
+        "gtc" orders rest until filled.
+
+    Account and position state is kept in numpy arrays indexed by symbol, and resting
+    orders in parallel arrays, so each bar is matched in a handful of vectorized
+    operations no matter how many orders are open.
+    """
+
+    def __init__(self, bars, starting_cash = PAPER_TRADING_STARTING_CASH, account_number = PAPER_TRADING_ACCOUNT_NUMBER):
+        """
+        bars is a dict mapping symbols to BAR_DTYPE arrays, e.g. the output of
+        RobinhoodInstance.get_historicals.
+        """
+
+        if len(bars) == 0 or all(len(symbol_bars) == 0 for symbol_bars in bars.values()):
+            raise BadArgument()
+
+        self.account_number = account_number
+        self.symbols = sorted(bars.keys())
+        self.symbol_index = dict((symbol, index) for index, symbol in enumerate(self.symbols))
+
+        # Line every symbol's bars up on one shared timeline.  Missing bars are NaN,
+        # so nothing can fill against them.
+        self.timeline = np.unique(np.concatenate([np.asarray(bars[symbol]['begins_at']) for symbol in self.symbols]))
+        self.days = self.timeline // (24 * 60 * 60)
+
+        shape = (len(self.timeline), len(self.symbols))
+        self.open = np.full(shape, np.nan)
+        self.high = np.full(shape, np.nan)
+        self.low = np.full(shape, np.nan)
+        self.close = np.full(shape, np.nan)
+
+        for index, symbol in enumerate(self.symbols):
+            symbol_bars = bars[symbol]
+            rows = np.searchsorted(self.timeline, symbol_bars['begins_at'])
+
+            self.open[rows, index] = symbol_bars['open']
+            self.high[rows, index] = symbol_bars['high']
+            self.low[rows, index] = symbol_bars['low']
+            self.close[rows, index] = symbol_bars['close']
+
+        # Market orders need a price even when a symbol has no bar at this step, so
+        # carry the last close forward.
+        last_valid_row = np.where(np.isnan(self.close), 0, np.arange(shape[0])[:, None])
+        np.maximum.accumulate(last_valid_row, axis=0, out=last_valid_row)
+        self.last_price = self.close[last_valid_row, np.arange(shape[1])]
+
+        self.step = 0
+        self._last_price_row = self.last_price[0]
+
+        # Account state
+        self.starting_cash = float(starting_cash)
+        self.cash = float(starting_cash)
+        self.cash_held_for_orders = 0.0
+
+        # Position state, one element per symbol
+        self.quantity = np.zeros(len(self.symbols))
+        self.average_buy_price = np.zeros(len(self.symbols))
+        self.shares_held_for_sells = np.zeros(len(self.symbols))
+        self.traded = np.zeros(len(self.symbols), dtype=bool)
+
+        # Resting limit orders, stored as parallel arrays.  Only the first
+        # open_order_count elements are live.
+        self.open_order_count = 0
+        self.open_order_id = np.zeros(PAPER_TRADING_INITIAL_ORDER_CAPACITY, dtype=np.int64)
+        self.open_order_symbol = np.zeros(PAPER_TRADING_INITIAL_ORDER_CAPACITY, dtype=np.int64)
+        self.open_order_side = np.zeros(PAPER_TRADING_INITIAL_ORDER_CAPACITY, dtype=np.int8)
+        self.open_order_quantity = np.zeros(PAPER_TRADING_INITIAL_ORDER_CAPACITY)
+        self.open_order_price = np.zeros(PAPER_TRADING_INITIAL_ORDER_CAPACITY)
+        self.open_order_gtc = np.zeros(PAPER_TRADING_INITIAL_ORDER_CAPACITY, dtype=bool)
+
+        self.next_order_id = 1
+        self.filled_order_count = 0
+        self.cancelled_order_count = 0
+
+    @classmethod
+    def from_historicals(cls, symbols, interval, span, starting_cash = PAPER_TRADING_STARTING_CASH):
+        """
+        Build a paper trading instance replaying bars fetched with
+        RobinhoodInstance.get_historicals.
+        """
+
+        return cls(RobinhoodInstance.get_historicals(symbols, interval, span), starting_cash)
+
+    # ------------------------------------------------------------------------- #
+    # Login/Authentication Functions                                            #
+    # ------------------------------------------------------------------------- #
+
+    def is_logged_in(self):
+        return True
+
+    def login(self, username=None, password=None):
+        pass
+
+    def logout(self):
+        pass
+
+    # ------------------------------------------------------------------------- #
+    # Replay                                                                    #
+    # ------------------------------------------------------------------------- #
+
+    def get_current_time(self):
+        """
+        Returns the begins_at timestamp (seconds since the epoch) of the current bar.
+        """
+
+        return int(self.timeline[self.step])
+
+    def get_current_price(self, ticker_symbol):
+        return float(self._last_price_row[self.symbol_index[ticker_symbol]])
+
+    def advance(self):
+        """
+        Move on to the next bar and fill whatever resting orders it reaches.
+
+        Returns False once the end of the replayed data has been reached.
+        """
+
+        if self.step + 1 >= len(self.timeline):
+            return False
+
+        self.step += 1
+        self._last_price_row = self.last_price[self.step]
+
+        if self.days[self.step] != self.days[self.step - 1]:
+            self._cancel_orders(~self.open_order_gtc[:self.open_order_count])
+
+        if self.open_order_count > 0:
+            self._match_open_orders()
+
+        return True
+
+    def replay(self, strategy):
+        """
+        Call strategy(self) once for every bar, from the current one to the end of
+        the replayed data.
+        """
+
+        while True:
+            strategy(self)
+
+            if not self.advance():
+                break
+
+    def _match_open_orders(self):
+        count = self.open_order_count
+        symbol = self.open_order_symbol[:count]
+        side = self.open_order_side[:count]
+        quantity = self.open_order_quantity[:count]
+        limit_price = self.open_order_price[:count]
+
+        bar_open = self.open[self.step, symbol]
+
+        with np.errstate(invalid='ignore'):
+            buy_fills = (side > 0) & (self.low[self.step, symbol] <= limit_price)
+            sell_fills = (side < 0) & (self.high[self.step, symbol] >= limit_price)
+
+        if not (buy_fills.any() or sell_fills.any()):
+            return
+
+        # Fill at the open if the bar gapped through the limit price
+        fill_price = np.where(buy_fills, np.fmin(limit_price, bar_open), np.fmax(limit_price, bar_open))
+
+        if buy_fills.any():
+            buy_symbol = symbol[buy_fills]
+            buy_quantity = quantity[buy_fills]
+            buy_price = fill_price[buy_fills]
+
+            cost_basis = self.quantity * self.average_buy_price
+            np.add.at(cost_basis, buy_symbol, buy_quantity * buy_price)
+            np.add.at(self.quantity, buy_symbol, buy_quantity)
+            self.average_buy_price = np.where(self.quantity > 0, cost_basis / np.where(self.quantity > 0, self.quantity, 1), 0.0)
+
+            self.cash -= float(np.dot(buy_quantity, buy_price))
+            self.cash_held_for_orders -= float(np.dot(buy_quantity, limit_price[buy_fills]))
+            self.traded[buy_symbol] = True
+
+        if sell_fills.any():
+            sell_symbol = symbol[sell_fills]
+            sell_quantity = quantity[sell_fills]
+
+            np.add.at(self.quantity, sell_symbol, -sell_quantity)
+            np.add.at(self.shares_held_for_sells, sell_symbol, -sell_quantity)
+            self.average_buy_price[self.quantity == 0] = 0.0
+
+            self.cash += float(np.dot(sell_quantity, fill_price[sell_fills]))
+
+        filled = buy_fills | sell_fills
+        self.filled_order_count += int(filled.sum())
+        self._compact_open_orders(~filled)
+
+    def _cancel_orders(self, cancelled):
+        """
+        Cancel the resting orders selected by the boolean mask cancelled and release
+        the cash and shares they were holding.
+        """
+
+        if not cancelled.any():
+            return
+
+        count = self.open_order_count
+        symbol = self.open_order_symbol[:count][cancelled]
+        side = self.open_order_side[:count][cancelled]
+        quantity = self.open_order_quantity[:count][cancelled]
+        limit_price = self.open_order_price[:count][cancelled]
+
+        buys = side > 0
+        self.cash_held_for_orders -= float(np.dot(quantity[buys], limit_price[buys]))
+        np.add.at(self.shares_held_for_sells, symbol[~buys], -quantity[~buys])
+
+        self.cancelled_order_count += len(symbol)
+        self._compact_open_orders(~cancelled)
+
+    def _compact_open_orders(self, keep):
+        count = int(keep.sum())
+
+        for array in (self.open_order_id, self.open_order_symbol, self.open_order_side,
+                      self.open_order_quantity, self.open_order_price, self.open_order_gtc):
+            array[:count] = array[:self.open_order_count][keep]
+
+        self.open_order_count = count
+
+    def _add_open_order(self, order_id, symbol, side, quantity, price, gtc):
+        if self.open_order_count == len(self.open_order_id):
+            capacity = 2 * len(self.open_order_id)
+
+            self.open_order_id = np.resize(self.open_order_id, capacity)
+            self.open_order_symbol = np.resize(self.open_order_symbol, capacity)
+            self.open_order_side = np.resize(self.open_order_side, capacity)
+            self.open_order_quantity = np.resize(self.open_order_quantity, capacity)
+            self.open_order_price = np.resize(self.open_order_price, capacity)
+            self.open_order_gtc = np.resize(self.open_order_gtc, capacity)
+
+        index = self.open_order_count
+        self.open_order_id[index] = order_id
+        self.open_order_symbol[index] = symbol
+        self.open_order_side[index] = side
+        self.open_order_quantity[index] = quantity
+        self.open_order_price[index] = price
+        self.open_order_gtc[index] = gtc
+
+        self.open_order_count += 1
+
+    # ------------------------------------------------------------------------- #
+    # Buy/Sell Orders                                                           #
+    # ------------------------------------------------------------------------- #
+
+    def buy_order(self, ticker_symbol, order_type, time_in_force, quantity, price = "0.01", trigger = "immediate"):
+        """
+        Simulated version of RobinhoodInstance.buy_order.  Returns a dict describing
+        the order, or False if it was rejected.
+        """
+
+        return self._submit_order(ticker_symbol, order_type, time_in_force, quantity, price, trigger, 1)
+
+    def sell_order(self, ticker_symbol, order_type, time_in_force, quantity, price = "0.01", trigger = "immediate"):
+        """
+        Simulated version of RobinhoodInstance.sell_order.  Returns a dict describing
+        the order, or False if it was rejected.
+        """
+
+        return self._submit_order(ticker_symbol, order_type, time_in_force, quantity, price, trigger, -1)
+
+    def _submit_order(self, ticker_symbol, order_type, time_in_force, quantity, price, trigger, side):
+        if trigger != "immediate" or order_type not in ("market", "limit") or time_in_force not in ("gfd", "gtc"):
+            raise BadArgument()
+
+        symbol = self.symbol_index.get(ticker_symbol)
+        if symbol is None:
+            return self._reject_order(side, "No replayed data for %s." % ticker_symbol)
+
+        quantity = float(quantity)
+        current_price = float(self._last_price_row[symbol])
+
+        if not (math.isfinite(quantity) and quantity > 0):
+            return self._reject_order(side, "Quantity must be a positive number.")
+
+        if current_price != current_price:
+            return self._reject_order(side, "No price for %s yet." % ticker_symbol)
+
+        if order_type == "market":
+            limit_price = current_price
+        else:
+            limit_price = float(price)
+
+            if not (math.isfinite(limit_price) and limit_price > 0):
+                return self._reject_order(side, "Price must be a positive number.")
+
+        # Limit orders that are already marketable fill at the current price, just
+        # like market orders.
+        marketable = (side > 0 and limit_price >= current_price) or (side < 0 and limit_price <= current_price)
+
+        if side > 0:
+            buying_power = self.cash - self.cash_held_for_orders
+            if quantity * (current_price if marketable else limit_price) > buying_power:
+                return self._reject_order(side, "Not enough buying power.")
+        else:
+            if quantity > self.quantity[symbol] - self.shares_held_for_sells[symbol]:
+                return self._reject_order(side, "Not enough shares.")
+
+        order_id = self.next_order_id
+        self.next_order_id += 1
+
+        if marketable:
+            self._fill_order(symbol, side, quantity, current_price)
+            state = "filled"
+            average_price = current_price
+        else:
+            if side > 0:
+                self.cash_held_for_orders += quantity * limit_price
+            else:
+                self.shares_held_for_sells[symbol] += quantity
+
+            self._add_open_order(order_id, symbol, side, quantity, limit_price, time_in_force == "gtc")
+            state = "confirmed"
+            average_price = None
+
+        return {
+                'id'            : str(order_id),
+                'account'       : 'paper://accounts/%s/' % self.account_number,
+                'symbol'        : ticker_symbol,
+                'type'          : order_type,
+                'time_in_force' : time_in_force,
+                'trigger'       : trigger,
+                'price'         : '%s' % limit_price,
+                'quantity'      : '%s' % quantity,
+                'side'          : 'buy' if side > 0 else 'sell',
+                'state'         : state,
+                'average_price' : average_price
+                }
+
+    def _fill_order(self, symbol, side, quantity, price):
+        position_quantity = self.quantity[symbol]
+
+        if side > 0:
+            self.average_buy_price[symbol] = (position_quantity * self.average_buy_price[symbol] + quantity * price) / (position_quantity + quantity)
+            self.quantity[symbol] = position_quantity + quantity
+            self.cash -= quantity * price
+            self.traded[symbol] = True
+        else:
+            self.quantity[symbol] = position_quantity - quantity
+            if position_quantity == quantity:
+                self.average_buy_price[symbol] = 0.0
+            self.cash += quantity * price
+
+        self.filled_order_count += 1
+
+    def _reject_order(self, side, reason):
+        if side > 0:
+            print_logger.error("[ERROR]: Buy order failed: %s", reason)
+        else:
+            print_logger.error("[ERROR]: Sell order failed: %s", reason)
+
+        return False
+
+    # ------------------------------------------------------------------------- #
+    # Account Helper Functions                                                  #
+    # ------------------------------------------------------------------------- #
+
+    def get_account_data(self, param):
+        """
+        Simulated version of RobinhoodInstance.get_account_data.  Money fields are
+        returned as strings, like the API does.
+        """
+
+        updated_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.get_current_time()))
+        buying_power = self.cash - self.cash_held_for_orders
+
+        cash_balances = {
+                'cash_held_for_orders'              : '%.4f' % self.cash_held_for_orders,
+                'cash'                              : '%.4f' % self.cash,
+                'buying_power'                      : '%.4f' % buying_power,
+                'updated_at'                        : updated_at,
+                'cash_available_for_withdrawal'     : '%.4f' % buying_power,
+                'uncleared_deposits'                : '0.0000',
+                'unsettled_funds'                   : '0.0000'
+                }
+
+        response = {
+                GET_DEACTIVATED                     : False,
+                GET_UPDATED_AT                      : updated_at,
+                GET_MARGIN_BALANCES                 : None,
+                GET_PORTFOLIO                       : 'paper://portfolios/%s/' % self.account_number,
+                GET_CASH_BALANCES                   : cash_balances,
+                GET_WITHDRAWL_HALTED                : False,
+                GET_CASH_AVAILABLE_FOR_WITHDRAWAL   : '%.4f' % buying_power,
+                GET_TYPE                            : 'cash',
+                GET_SMA                             : None,
+                GET_SWEEP_ENABLED                   : False,
+                GET_DEPOSIT_HALTED                  : False,
+                GET_BUYING_POWER                    : '%.4f' % buying_power,
+                GET_USER                            : None,
+                GET_MAX_ACH_EARLY_ACCESS_AMOUNT     : '0.00',
+                GET_CASH_HELD_FOR_ORDERS            : '%.4f' % self.cash_held_for_orders,
+                GET_ONLY_POSITION_CLOSING_TRADES    : False,
+                GET_URL                             : 'paper://accounts/%s/' % self.account_number,
+                GET_POSITIONS                       : 'paper://accounts/%s/positions/' % self.account_number,
+                GET_CREATED_AT                      : time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(int(self.timeline[0]))),
+                GET_CASH                            : '%.4f' % self.cash,
+                GET_SMA_HELD_FOR_ORDERS             : None,
+                GET_ACCOUNT_NUMBER                  : self.account_number,
+                GET_UNCLEARED_DEPOSITS              : '0.0000',
+                GET_UNSETTLED_FUNDS                 : '0.0000'
+                }
+
+        if param == GET_ALL:
+            return response
+        elif param in response.keys():
+            return response[param]
+        else:
+            raise BadArgument()
+
+    def get_equity(self):
+        """
+        Returns cash plus the value of all positions at the current prices.
+        """
+
+        return self.cash + float(np.nansum(self.quantity * self._last_price_row))
+
+    # ------------------------------------------------------------------------- #
+    # Position Information                                                      #
+    # ------------------------------------------------------------------------- #
+
+    def get_position_history(self, active = False):
+        """
+        Simulated version of RobinhoodInstance.get_position_history.  Every symbol
+        that has been bought during the replay has a position entry.
+        """
+
+        updated_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.get_current_time()))
+
+        positions = [{
+                'account'               : 'paper://accounts/%s/' % self.account_number,
+                'average_buy_price'     : '%.4f' % self.average_buy_price[index],
+                'instrument'            : 'paper://instruments/%s/' % self.symbols[index],
+                'quantity'              : '%.4f' % self.quantity[index],
+                'shares_held_for_sells' : '%.4f' % self.shares_held_for_sells[index],
+                'updated_at'            : updated_at,
+                'url'                   : 'paper://accounts/%s/positions/%s/' % (self.account_number, self.symbols[index])
+                } for index in np.flatnonzero(self.traded)]
+
+        if active is True:
+            return [position for position in positions if float(position["quantity"]) != 0.0]
+        else:
+            return {"results" : positions}
+
 
 if __name__ == "__main__":
 